@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共通グリッド上で複数ソースの標高を優先順位つきで合成する。
+
+ソースは優先順位の高い順（DEM5A → DEM5B → DEM10B）に
+流し込む。すでに値が入っているピクセルは上書きしないので、
+各ピクセルには「有効値を持つ最も優先順位の高いソース」の値が入る。
+オプションで、各ピクセルの取得元を uint8 のソース ID として記録する。
+"""
+
+import numpy as np
+import rasterio
+from rasterio.transform import Affine
+
+# local subroutine
+from _terrain import sidecar_path
+
+# ソース ID（0 は値なし）
+SOURCE_IDS = {
+    "DEM5A": 1,
+    "DEM5B": 2,
+    "DEM10B": 3,
+}
+BLOCK_ROWS = 256
+
+
+class Compositor:
+    """
+    出力グリッド (height, width) の合成器。
+
+    - paste      : タイルなど小さな配列を (r0, c0) に流し込む
+    - fill_blocks: 全体グリッドのソースを、block_rows 行ずつ読み出す関数で流し込む
+                   （全体サイズの一時配列を作らない）
+    欠損は NaN または nodata_value。
+    """
+
+    def __init__(
+        self,
+        height: int,
+        width: int,
+        nodata_value: float = -9999.0,
+        with_source_id: bool = False,
+    ):
+        self.nodata_value = nodata_value
+        self.dem = np.full((height, width), nodata_value, dtype="float32")
+        self.source_id = np.zeros((height, width), dtype="uint8") if with_source_id else None
+
+    @property
+    def shape(self):
+        return self.dem.shape
+
+    def _valid(self, data):
+        return ~np.isnan(data) & (data != self.nodata_value)
+
+    def paste(self, data, r0: int, c0: int, source: str):
+        """
+        data を (r0, c0) から流し込み、新たに埋まったピクセル数を返す。
+        グリッド外にはみ出した部分は捨てる。
+        """
+        height, width = self.shape
+        r1 = min(r0 + data.shape[0], height)
+        c1 = min(c0 + data.shape[1], width)
+        if r1 <= r0 or c1 <= c0:
+            return 0
+        data = data[: r1 - r0, : c1 - c0]
+
+        dest = self.dem[r0:r1, c0:c1]
+        overwrite = (dest == self.nodata_value) & self._valid(data)
+        dest[overwrite] = data[overwrite]
+        if self.source_id is not None:
+            self.source_id[r0:r1, c0:c1][overwrite] = SOURCE_IDS[source]
+        return int(np.count_nonzero(overwrite))
+
+    def fill_blocks(self, read_rows, source: str, block_rows: int = BLOCK_ROWS):
+        """
+        read_rows(r0, r1) が出力グリッドの行 r0..r1-1 に相当する
+        (r1 - r0, width) 配列を返すソースで、まだ空いているピクセルを埋める。
+        空きのないブロックは read_rows を呼ばない。埋めたピクセル数を返す。
+        """
+        filled = 0
+        height = self.shape[0]
+        for r0 in range(0, height, block_rows):
+            r1 = min(r0 + block_rows, height)
+            if not np.any(self.dem[r0:r1] == self.nodata_value):
+                continue
+            data = read_rows(r0, r1)
+            if data is None:
+                continue
+            filled += self.paste(data, r0, 0, source)
+        return filled
+
+    def has_gaps(self):
+        return bool(np.any(self.dem == self.nodata_value))
+
+    def write_source_id(self, out_tif: str, transform, crs="EPSG:4326"):
+        """
+        ソース ID を <out_tif>_source.tif（uint8, nodata=0）に書き出してパスを返す。
+        """
+        if self.source_id is None:
+            raise ValueError("with_source_id=True で作成してください。")
+        path = sidecar_path(out_tif, "source")
+        height, width = self.shape
+        profile = {
+            "driver": "GTiff",
+            "dtype": "uint8",
+            "count": 1,
+            "width": width,
+            "height": height,
+            "crs": crs,
+            "transform": transform,
+            "nodata": 0,
+        }
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(self.source_id, 1)
+            dst.update_tags(1, **{f"SOURCE_{v}": k for k, v in SOURCE_IDS.items()})
+        print(f"saved source: {path}")
+        return path
+
+
+def row_window_transform(transform, r0: int):
+    """ 出力グリッドの行 r0 から始まるブロックの transform """
+    return transform * Affine.translation(0, r0)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+差分更新用のビルドマニフェスト（<出力名>.manifest.json）。
+
+前回ビルドで使ったタイルの ETag / Last-Modified や、
+GML メッシュの公開日（ファイル名の -DEM5A-20250620 など）を記録しておき、
+次回は変わったものだけを取り直す。
+"""
+
+import os
+import re
+import json
+
+MANIFEST_VERSION = 2
+
+# FG-GML-6243-72-10-DEM5A-20250620.xml -> ("FG-GML-6243-72-10", "DEM5A", "20250620")
+_MESH_DATE_RE = re.compile(r"^(.*?)-(DEM[0-9A-Z]+)-(\d{8})(?:\D|$)")
+
+
+def manifest_path(out_tif: str):
+    """ 'dem.tif' -> 'dem.manifest.json' """
+    root, _ = os.path.splitext(str(out_tif))
+    return f"{root}.manifest.json"
+
+
+def load_manifest(out_tif: str):
+    """ マニフェストを読み込む。無い・版が違う場合は None。 """
+    path = manifest_path(out_tif)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != MANIFEST_VERSION:
+        return None
+    return data
+
+
+def save_manifest(out_tif: str, data: dict):
+    """ マニフェストを書き出してパスを返す（一時ファイル経由で置き換え）。 """
+    path = manifest_path(out_tif)
+    data = dict(data, version=MANIFEST_VERSION)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    print(f"saved manifest: {path}")
+    return path
+
+
+def tile_key(x: int, y: int):
+    return f"{x}/{y}"
+
+
+def parse_tile_key(key: str):
+    x, y = key.split("/")
+    return int(x), int(y)
+
+# -------------------------------
+# HTTP 条件付きリクエスト
+# -------------------------------
+
+def response_meta(url: str, response):
+    """ レスポンスから条件付きリクエスト用の情報を取り出す。 """
+    meta = {"url": url}
+    if response.headers.get("ETag"):
+        meta["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        meta["last_modified"] = response.headers["Last-Modified"]
+    return meta
+
+
+def conditional_headers(meta: dict | None):
+    """ 前回の meta から If-None-Match / If-Modified-Since を作る。 """
+    headers = {}
+    if not meta:
+        return headers
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+# -------------------------------
+# GML メッシュの公開日
+# -------------------------------
+
+def mesh_release(path: str):
+    """
+    GSI の DEM ファイル名から (メッシュ, 種類, 公開日 'YYYYMMDD') を返す。
+    読み取れなければ (None, None, None)。
+    """
+    m = _MESH_DATE_RE.match(os.path.basename(str(path)))
+    if m is None:
+        return None, None, None
+    return m.group(1), m.group(2), m.group(3)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メモリ上の標高モザイク（EPSG:4326）から傾斜・斜面方位・陰影起伏を計算し、
+サイドカー GeoTIFF（<出力名>_slope.tif など）に書き出す。
+
+- 差分は Horn 法（3x3, gdaldem と同じ）
+- 1 度あたりのメートルは行ごとの緯度で計算（WGS84 楕円体）
+- 256 行ずつ上下 1 ピクセルののりしろ付きで処理するので、
+  派生プロダクト用の全体サイズの一時配列は作らない
+"""
+
+import os
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+PRODUCTS = ("slope", "aspect", "hillshade")
+BLOCK_ROWS = 256
+
+# -------------------------------
+# 1 度あたりの距離
+# -------------------------------
+
+def meters_per_degree(lat_deg):
+    """
+    緯度 lat_deg における (経度 1 度, 緯度 1 度) の長さ [m]（WGS84 楕円体の近似式）
+    """
+    phi = np.radians(np.asarray(lat_deg, dtype="float64"))
+    m_lon = 111412.84 * np.cos(phi) - 93.5 * np.cos(3 * phi) + 0.118 * np.cos(5 * phi)
+    m_lat = 111132.92 - 559.82 * np.cos(2 * phi) + 1.175 * np.cos(4 * phi) - 0.0023 * np.cos(6 * phi)
+    return m_lon, m_lat
+
+# -------------------------------
+# ブロック単位の計算
+# -------------------------------
+
+def terrain_block(
+    padded,
+    lats,
+    lon_step: float,
+    lat_step: float,
+    azimuth: float = 315.0,
+    altitude: float = 45.0,
+):
+    """
+    上下左右に 1 ピクセルののりしろを付けた標高ブロック padded (h+2, w+2)
+    から (slope[度], aspect[度], hillshade[0-1]) を返す（各 (h, w), float32）。
+    欠損は NaN（近傍 3x3 に NaN があれば NaN）。平坦な場所の aspect は NaN。
+
+    Parameters
+    ----------
+    padded : ndarray
+        NaN を欠損とした標高（のりしろ込み）
+    lats : ndarray
+        のりしろを除いた各行の中心緯度 (h,)
+    lon_step, lat_step : float
+        1 ピクセルの経度・緯度の大きさ [度]（符号は無視）
+    """
+    z = padded.astype("float32", copy=False)
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d,    f = z[1:-1, :-2],              z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+
+    m_lon, m_lat = meters_per_degree(lats)
+    dx = (abs(lon_step) * m_lon).astype("float32")[:, None]
+    dy = (abs(lat_step) * m_lat).astype("float32")[:, None]
+
+    # 東向き・北向きの勾配（行は南向きに増える）
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * dx)
+    dzdn = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * dy)
+
+    grad = np.hypot(dzdx, dzdn)
+    slope_rad = np.arctan(grad)
+    # 下り方向の方位（北から時計回り）
+    aspect_rad = np.arctan2(-dzdx, -dzdn)
+
+    zenith = np.radians(90.0 - altitude)
+    az = np.radians(azimuth)
+    shade = (
+        np.cos(zenith) * np.cos(slope_rad)
+        + np.sin(zenith) * np.sin(slope_rad) * np.cos(az - aspect_rad)
+    )
+
+    slope = np.degrees(slope_rad).astype("float32")
+    aspect = np.mod(np.degrees(aspect_rad), 360.0).astype("float32")
+    aspect[grad == 0] = np.nan
+    hillshade = np.clip(shade, 0.0, 1.0).astype("float32")
+    return slope, aspect, hillshade
+
+# -------------------------------
+# サイドカー出力
+# -------------------------------
+
+def _write_block(dsts, window, slope, aspect, hillshade):
+    """ 計算結果を nodata 付きでサイドカーの window に書く。 """
+    if "slope" in dsts:
+        dsts["slope"].write(np.where(np.isnan(slope), -9999.0, slope).astype("float32"), 1, window=window)
+    if "aspect" in dsts:
+        dsts["aspect"].write(np.where(np.isnan(aspect), -9999.0, aspect).astype("float32"), 1, window=window)
+    if "hillshade" in dsts:
+        hs = np.where(np.isnan(hillshade), 0, 1 + np.round(hillshade * 254)).astype("uint8")
+        dsts["hillshade"].write(hs, 1, window=window)
+
+
+def sidecar_path(out_tif: str, product: str):
+    """ 'dem.tif' -> 'dem_slope.tif' """
+    root, ext = os.path.splitext(str(out_tif))
+    return f"{root}_{product}{ext or '.tif'}"
+
+
+def check_products(products):
+    """
+    products（None / 1 つの名前 / 名前のリスト）をタプルにして返す。
+    PRODUCTS 以外の名前があれば ValueError。
+    """
+    if products is None:
+        return ()
+    if isinstance(products, str):
+        products = (products,)
+    products = tuple(products)
+    unknown = set(products) - set(PRODUCTS)
+    if unknown:
+        raise ValueError(f"未対応のプロダクトです: {sorted(unknown)}")
+    return products
+
+
+def write_terrain_products(
+    dem,
+    transform,
+    out_tif: str,
+    products=PRODUCTS,
+    nodata_value: float | None = None,
+    crs="EPSG:4326",
+    block_rows: int = BLOCK_ROWS,
+):
+    """
+    標高配列 dem (height, width) と transform から、products で指定した
+    派生プロダクトをサイドカー GeoTIFF に書き出し、{名前: パス} を返す。
+
+    - slope     : 傾斜 [度], float32, nodata=-9999
+    - aspect    : 斜面方位 [度, 北から時計回り], float32, nodata=-9999（平坦も nodata）
+    - hillshade : 陰影起伏 (方位 315°, 高度 45°), uint8 1-255, nodata=0
+
+    dem 中の nodata_value と NaN を欠損として扱う。
+    """
+    products = check_products(products)
+    if not products:
+        return {}
+
+    height, width = dem.shape
+    lon_step = transform.a
+    lat_step = transform.e
+    # 各行の中心緯度
+    row_lats = transform.f + lat_step * (np.arange(height) + 0.5)
+
+    out_paths = {p: sidecar_path(out_tif, p) for p in products}
+    dsts = {}
+    try:
+        for p in products:
+            byte = p == "hillshade"
+            dsts[p] = rasterio.open(
+                out_paths[p],
+                "w",
+                driver="GTiff",
+                dtype="uint8" if byte else "float32",
+                count=1,
+                width=width,
+                height=height,
+                crs=crs,
+                transform=transform,
+                nodata=0 if byte else -9999.0,
+            )
+
+        for r0 in range(0, height, block_rows):
+            r1 = min(r0 + block_rows, height)
+            # 上下 1 行ののりしろ（端は端の行を複製）
+            src = dem[max(r0 - 1, 0) : min(r1 + 1, height)].astype("float32")
+            if nodata_value is not None:
+                src[src == nodata_value] = np.nan
+            pad_top = 1 if r0 == 0 else 0
+            pad_bottom = 1 if r1 == height else 0
+            padded = np.pad(src, ((pad_top, pad_bottom), (1, 1)), mode="edge")
+
+            slope, aspect, hillshade = terrain_block(
+                padded, row_lats[r0:r1], lon_step, lat_step
+            )
+            window = Window(0, r0, width, r1 - r0)
+
+            _write_block(dsts, window, slope, aspect, hillshade)
+    finally:
+        for dst in dsts.values():
+            dst.close()
+
+    for p, path in out_paths.items():
+        print(f"saved {p}: {path}")
+    return out_paths
+
+
+def update_terrain_products(
+    out_tif: str,
+    windows,
+    products=PRODUCTS,
+    nodata_value: float | None = None,
+):
+    """
+    書き出し済みの標高 GeoTIFF のうち windows（rasterio の Window のリスト）の
+    範囲だけ、既存のサイドカーを計算し直して上書きする。
+    各 window は 1 ピクセルののりしろ付きで読み直す（端は端の画素を複製）。
+    """
+    products = check_products(products)
+    if not products:
+        return
+
+    dsts = {}
+    with rasterio.open(out_tif) as src:
+        height, width = src.height, src.width
+        transform = src.transform
+        try:
+            for p in products:
+                dsts[p] = rasterio.open(sidecar_path(out_tif, p), "r+")
+
+            for window in windows:
+                r0, c0 = int(window.row_off), int(window.col_off)
+                r1, c1 = r0 + int(window.height), c0 + int(window.width)
+                rr0, rr1 = max(r0 - 1, 0), min(r1 + 1, height)
+                cc0, cc1 = max(c0 - 1, 0), min(c1 + 1, width)
+                block = src.read(1, window=Window(cc0, rr0, cc1 - cc0, rr1 - rr0)).astype("float32")
+                if nodata_value is not None:
+                    block[block == nodata_value] = np.nan
+                padded = np.pad(
+                    block,
+                    ((rr0 - (r0 - 1), (r1 + 1) - rr1), (cc0 - (c0 - 1), (c1 + 1) - cc1)),
+                    mode="edge",
+                )
+                lats = transform.f + transform.e * (np.arange(r0, r1) + 0.5)
+                slope, aspect, hillshade = terrain_block(padded, lats, transform.a, transform.e)
+                _write_block(dsts, window, slope, aspect, hillshade)
+        finally:
+            for dst in dsts.values():
+                dst.close()
+
+    print(f"updated {len(products)} products in {len(windows)} windows")
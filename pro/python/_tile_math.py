@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地理院タイル（Webメルカトル）のタイル座標 ⇔ 緯度経度 変換（NumPy 配列版）。
+
+スカラーを渡せばスカラー（int / float）、配列を渡せば同じ形の配列を返す。
+式は地理院タイル／Google Maps と同じ。
+"""
+
+import math
+import numpy as np
+
+TILE_SIZE = 256
+
+
+def _out(a):
+    """0 次元配列は Python のスカラーに戻す。"""
+    a = np.asarray(a)
+    return a.item() if a.ndim == 0 else a
+
+
+def _lat_to_merc(lat_deg, n):
+    """緯度 -> タイル単位の y（実数）。"""
+    lat_rad = np.radians(np.asarray(lat_deg, dtype="float64"))
+    return (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * n
+
+
+def _merc_to_lat(y, n):
+    """タイル単位の y（実数） -> 緯度。"""
+    y = np.asarray(y, dtype="float64")
+    return np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y / n))))
+
+# -------------------------------
+# 緯度経度 -> タイル／ピクセル
+# -------------------------------
+
+def latlon_to_tile(lat_deg, lon_deg, zoom: int):
+    """
+    緯度経度(WGS84) -> Webメルカトルのタイル座標 (x, y)
+    """
+    n = 2 ** zoom
+    x = np.floor((np.asarray(lon_deg, dtype="float64") + 180.0) / 360.0 * n).astype("int64")
+    y = np.floor(_lat_to_merc(lat_deg, n)).astype("int64")
+    return _out(x), _out(y)
+
+
+def latlon_to_pixel(lat_deg, lon_deg, zoom: int):
+    """
+    緯度経度 -> ズーム zoom での全体ピクセル座標 (px, py)（実数）。
+    整数部を 256 で割ったものがタイル番号、余りがタイル内のピクセル番号。
+    ピクセル (i, j) の中心は (i + 0.5, j + 0.5)。
+    """
+    n = 2 ** zoom * TILE_SIZE
+    px = (np.asarray(lon_deg, dtype="float64") + 180.0) / 360.0 * n
+    py = _lat_to_merc(lat_deg, n)
+    return _out(px), _out(py)
+
+
+def latlon_to_tile_pixel(lat_deg, lon_deg, zoom: int):
+    """
+    緯度経度 -> (タイル x, タイル y, タイル内列, タイル内行)（すべて整数）
+    """
+    px, py = latlon_to_pixel(lat_deg, lon_deg, zoom)
+    ix = np.floor(px).astype("int64")
+    iy = np.floor(py).astype("int64")
+    return (
+        _out(ix // TILE_SIZE),
+        _out(iy // TILE_SIZE),
+        _out(ix % TILE_SIZE),
+        _out(iy % TILE_SIZE),
+    )
+
+# -------------------------------
+# タイル／ピクセル -> 緯度経度
+# -------------------------------
+
+def tile_to_latlon(x, y, zoom: int):
+    """
+    タイル座標 (x, y, z) -> 左上隅の緯度経度 (lat, lon)
+    """
+    n = 2 ** zoom
+    lon_deg = np.asarray(x, dtype="float64") / n * 360.0 - 180.0
+    lat_deg = _merc_to_lat(y, n)
+    return _out(lat_deg), _out(lon_deg)
+
+
+def pixel_to_latlon(px, py, zoom: int):
+    """
+    全体ピクセル座標 (px, py)（実数可） -> 緯度経度 (lat, lon)。
+    ピクセル中心を求めるときは px + 0.5, py + 0.5 を渡す。
+    """
+    n = 2 ** zoom * TILE_SIZE
+    lon_deg = np.asarray(px, dtype="float64") / n * 360.0 - 180.0
+    lat_deg = _merc_to_lat(py, n)
+    return _out(lat_deg), _out(lon_deg)
+
+
+def tile_pixel_centers(x0: int, y0: int, x1: int, y1: int, zoom: int):
+    """
+    タイル範囲 x0..x1, y0..y1（両端含む）をモザイクしたラスタの
+    各ピクセル中心の緯度経度を返す。
+
+    Webメルカトルでは経度は列ごとに等間隔だが緯度は行ごとに不等間隔なので、
+    (lats, lons) をそれぞれ長さ height, width の 1 次元配列で返す。
+    2 次元が必要なら np.meshgrid(lons, lats) を使う。
+    """
+    cols = np.arange(x0 * TILE_SIZE, (x1 + 1) * TILE_SIZE, dtype="float64") + 0.5
+    rows = np.arange(y0 * TILE_SIZE, (y1 + 1) * TILE_SIZE, dtype="float64") + 0.5
+    lats, _ = pixel_to_latlon(0.0, rows, zoom)
+    _, lons = pixel_to_latlon(cols, 0.0, zoom)
+    return lats, lons
+
+
+if __name__ == "__main__":
+    # スカラー版（math）と一致するか確認
+    def _latlon_to_tile_scalar(lat_deg, lon_deg, zoom):
+        lat_rad = math.radians(lat_deg)
+        n = 2 ** zoom
+        x = int((lon_deg + 180.0) / 360.0 * n)
+        y = int((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+        return x, y
+
+    def _tile_to_latlon_scalar(x, y, zoom):
+        n = 2 ** zoom
+        lon_deg = x / n * 360.0 - 180.0
+        lat_deg = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+        return lat_deg, lon_deg
+
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(20.0, 46.0, 10000)
+    lons = rng.uniform(122.0, 154.0, 10000)
+
+    for zoom in (14, 15):
+        tx, ty = latlon_to_tile(lats, lons, zoom)
+        ref = np.array([_latlon_to_tile_scalar(a, o, zoom) for a, o in zip(lats, lons)])
+        assert np.array_equal(tx, ref[:, 0]) and np.array_equal(ty, ref[:, 1])
+        assert latlon_to_tile(lats[0], lons[0], zoom) == tuple(ref[0])
+
+        la, lo = tile_to_latlon(tx, ty, zoom)
+        ref = np.array([_tile_to_latlon_scalar(x, y, zoom) for x, y in zip(tx, ty)])
+        assert np.allclose(la, ref[:, 0], rtol=0, atol=1e-12)
+        assert np.allclose(lo, ref[:, 1], rtol=0, atol=1e-12)
+
+        # ピクセル -> 緯度経度 -> ピクセル の往復
+        px, py = latlon_to_pixel(lats, lons, zoom)
+        la, lo = pixel_to_latlon(px, py, zoom)
+        assert np.allclose(la, lats, rtol=0, atol=1e-9)
+        assert np.allclose(lo, lons, rtol=0, atol=1e-9)
+
+        # ピクセル中心はそのピクセルのタイルに戻る
+        x0, y0 = int(tx.min()), int(ty.min())
+        c_lat, c_lon = tile_pixel_centers(x0, y0, x0 + 1, y0 + 2, zoom)
+        assert c_lat.shape == (3 * TILE_SIZE,) and c_lon.shape == (2 * TILE_SIZE,)
+        gx, gy, col, row = latlon_to_tile_pixel(c_lat[:, None], c_lon[None, :], zoom)
+        assert np.array_equal(col[0], np.arange(2 * TILE_SIZE) % TILE_SIZE)
+        assert np.array_equal(row[:, 0], np.arange(3 * TILE_SIZE) % TILE_SIZE)
+        assert np.array_equal(gx[0], x0 + np.arange(2 * TILE_SIZE) // TILE_SIZE)
+        assert np.array_equal(gy[:, 0], y0 + np.arange(3 * TILE_SIZE) // TILE_SIZE)
+
+    print("ok")
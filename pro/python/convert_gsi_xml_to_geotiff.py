@@ -9,16 +9,37 @@ from pathlib import Path
 
 # local subroutine
 from _load_gsidem import _load_gsidem  
+from _terrain import write_terrain_products, check_products, sidecar_path
+from _manifest import load_manifest, save_manifest, mesh_release
 #debug
 import pdb
 
 
-def convert_gsi_xml_to_geotiff_latlon(xml_path, out_tif, set_nodata: float | None = None):
+def convert_gsi_xml_to_geotiff_latlon(xml_path, out_tif, set_nodata: float | None = None, products=None, update: bool = False):
     """
     GSIDEM XML -> WGS84 (EPSG:4326) の “一般的な” GeoTIFF（ストライプ方式）
     - 圧縮: deflate（必要なければ None に変更可）
     - nodata タグは省略（データ中の NaN をそのまま保持）。付けたい場合は set_nodata を数値で指定
+    - products に "slope", "aspect", "hillshade" を指定すると <out_tif>_slope.tif などのサイドカーも出力
+    - update=True のときは前回のマニフェストと比べ、同じメッシュで公開日
+      （ファイル名の -DEM5A-20250620 など）が新しくなっておらず、
+      products のサイドカーもすべて書き出し済みなら何もせず False を返す
     """
+    products = check_products(products)
+    mesh, kind, date = mesh_release(xml_path)
+    if update and Path(out_tif).exists():
+        prev = (load_manifest(out_tif) or {}).get("mesh", {})
+        if (
+            date is not None
+            and prev.get("mesh") == mesh
+            and prev.get("kind") == kind
+            and (prev.get("date") or "") >= date
+            and set(products) <= set(prev.get("products", []))
+            and all(Path(sidecar_path(out_tif, p)).exists() for p in products)
+        ):
+            print(f"up to date: {mesh} {kind} {prev['date']}")
+            return False
+
     # 読み込み（欠損は NaN 前提）
     xs, ys, zs, _ = _load_gsidem(xml_path)
     xs = np.asarray(xs, dtype=float)
@@ -68,7 +89,15 @@ def convert_gsi_xml_to_geotiff_latlon(xml_path, out_tif, set_nodata: float | Non
     with rasterio.open(out_tif, "w", **profile) as dst:
         dst.write(arr, 1)
 
+    if products:
+        write_terrain_products(arr, transform, out_tif, products, set_nodata)
+
+    save_manifest(out_tif, {"mesh": {
+        "mesh": mesh, "kind": kind, "date": date, "xml": str(xml_path), "products": list(products),
+    }})
+
     print("success!")
+    return True
 
 if __name__ == "__main__":
     # テスト
@@ -5,96 +5,27 @@ ChatGPT
 国土地理院の標高タイル DEM5A/DEM5B を、
 左上・右下の緯度経度（WGS84）で指定した範囲について
 必要なタイルを自動ダウンロードし、1枚の GeoTIFF に出力するスクリプト。
+DEM5A の欠けは同じタイルの DEM5B でピクセルごとに埋める
+（download_dem5_fill10_bbox と同じ mosaic_dem5_tile を使う）。
 
 出典: 「地理院タイル（標高タイル）」
   https://cyberjapandata.gsi.go.jp/xyz/dem5a/{z}/{x}/{y}.txt
+  https://cyberjapandata.gsi.go.jp/xyz/dem5b/{z}/{x}/{y}.txt
 利用時は「地理院タイル」「国土地理院」と出典を明記してください。
 """
 
 import os
-import math
-import csv
-import io
 import sys
 import requests
 import numpy as np
 import rasterio
 from rasterio.transform import from_bounds
 
-# 標高タイル URL テンプレート
-DEM5A_URL = "https://cyberjapandata.gsi.go.jp/xyz/dem5a/{z}/{x}/{y}.txt"
-DEM5B_URL = "https://cyberjapandata.gsi.go.jp/xyz/dem5b/{z}/{x}/{y}.txt"
-
-USER_AGENT = "Mozilla/5.0 (compatible; dem5-downloader/1.0; +https://maps.gsi.go.jp/)"
-
-def latlon_to_tile(lat_deg: float, lon_deg: float, zoom: int):
-    """
-    緯度経度(WGS84) -> Webメルカトルのタイル座標 (x, y)
-    （地理院タイル／Google Maps と同じ式）
-    """
-    lat_rad = math.radians(lat_deg)
-    n = 2 ** zoom
-    x = int((lon_deg + 180.0) / 360.0 * n)
-    y = int(
-        (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi)
-        / 2.0
-        * n
-    )
-    return x, y
-
-
-def tile_to_latlon(x: int, y: int, zoom: int):
-    """
-    タイル座標 (x, y, z) -> 左上隅の緯度経度 (lat, lon)
-    """
-    n = 2 ** zoom
-    lon_deg = x / n * 360.0 - 180.0
-    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
-    lat_deg = math.degrees(lat_rad)
-    return lat_deg, lon_deg
-
-
-def fetch_one_tile(z: int, x: int, y: int, session: requests.Session, timeout=10.0):
-    """
-    1枚のタイルをダウンロードして numpy.ndarray (256x256, float32) を返す。
-    まず DEM5A を試し、ダメなら DEM5B を試す。
-    どちらも取得できなければ RuntimeError。
-    """
-    headers = {"User-Agent": USER_AGENT}
-
-    def _download(url):
-        r = session.get(url, headers=headers, timeout=timeout)
-        if r.status_code != 200:
-            return None
-        txt = r.text.strip()
-        if not txt:
-            return None
-
-        reader = csv.reader(io.StringIO(txt))
-        rows = list(reader)
-        if len(rows) != 256 or any(len(row) != 256 for row in rows):
-            return None
-
-        arr = np.empty((256, 256), dtype="float32")
-        for i, row in enumerate(rows):
-            for j, val in enumerate(row):
-                if val == "e":
-                    arr[i, j] = np.nan  # 一旦 NaN
-                else:
-                    arr[i, j] = float(val)
-        return arr
-
-    url_a = DEM5A_URL.format(z=z, x=x, y=y)
-    data = _download(url_a)
-    if data is not None:
-        return data, "DEM5A", url_a
-
-    url_b = DEM5B_URL.format(z=z, x=x, y=y)
-    data = _download(url_b)
-    if data is not None:
-        return data, "DEM5B", url_b
-
-    raise RuntimeError(f"No DEM5A/5B tile at z={z}, x={x}, えぃty={y}")
+# local subroutine
+from _tile_math import latlon_to_tile, tile_to_latlon
+from _terrain import write_terrain_products, check_products
+from _composite import Compositor
+from download_dem5_fill10_bbox import fetch_tile, mosaic_dem5_tile
 
 
 def download_dem5_bbox(
@@ -105,6 +36,8 @@ def download_dem5_bbox(
     east: float,
     zoom: int = 15,
     nodata_value: float = -9999.0,
+    products=None,
+    source_mask: bool = False,
 ):
 
     
@@ -128,6 +61,11 @@ def download_dem5_bbox(
         ズームレベル（DEM5A/5B は z=15 が標準）
     nodata_value : float
         NoData に使う値
+    products : tuple of str, optional
+        派生プロダクト（"slope", "aspect", "hillshade"）を指定すると、
+        メモリ上の標高から計算して <out_tif>_slope.tif などのサイドカーに書き出す
+    source_mask : bool
+        True なら各ピクセルの取得元（DEM5A=1, DEM5B=2）を <out_tif>_source.tif に書き出す
     """
 
     print("out_tif =", out_tif, "type:", type(out_tif))
@@ -137,6 +75,8 @@ def download_dem5_bbox(
         raise ValueError("south < north になるように指定してください。")
     if east <= west:
         raise ValueError("east > west になるように指定してください。")
+    # 不正な名前はダウンロード前に弾く
+    products = check_products(products)
 
     # 範囲の4隅ではなく、北端・南端・西端・東端それぞれから代表タイルを取る
     # （タイル境界誤差を減らすため、少し内側にオフセットしてもよい）
@@ -159,30 +99,20 @@ def download_dem5_bbox(
     print(f"tile y range: {y0}..{y1} (count={v_tiles})")
     print(f"output raster size: {width} x {height}")
 
-    dem = np.full((height, width), nodata_value, dtype="float32")
+    comp = Compositor(height, width, nodata_value, with_source_id=source_mask)
 
     with requests.Session() as sess:
+        fetch = lambda kind, z, x, y: fetch_tile(kind, z, x, y, sess)
         for ty in range(y0, y1 + 1):
             for tx in range(x0, x1 + 1):
                 iy = ty - y0
                 ix = tx - x0
-                print(f"fetching tile z={zoom}, x={tx}, y={ty} ...")
                 try:
-                    tile_arr, kind, url = fetch_one_tile(zoom, tx, ty, sess)
-                    print(f"  -> {kind} from {url}")
+                    mosaic_dem5_tile(comp, iy * 256, ix * 256, zoom, tx, ty, fetch)
                 except Exception as e:
                     print(f"  !! FAILED: z={zoom}, x={tx}, y={ty}, error={e}")
-                    continue
 
-                r0 = iy * 256
-                c0 = ix * 256
-                dest = dem[r0 : r0 + 256, c0 : c0 + 256]
-
-                tile = tile_arr.copy()
-                mask_valid = ~np.isnan(tile)
-                overwrite = (dest == nodata_value) & mask_valid
-                dest[overwrite] = tile[overwrite]
-                dem[r0 : r0 + 256, c0 : c0 + 256] = dest
+    dem = comp.dem
 
     # 取得したタイル全体の実際の境界（タイル境界）を算出
     north_bound, west_bound = tile_to_latlon(x0, y0, zoom)
@@ -209,6 +139,12 @@ def download_dem5_bbox(
         dst.write(dem, 1)
 
     print(f"saved: {out_tif}")
+
+    if source_mask:
+        comp.write_source_id(out_tif, transform)
+
+    if products:
+        write_terrain_products(dem, transform, out_tif, products, nodata_value)
           
           
 if __name__ == "__main__":
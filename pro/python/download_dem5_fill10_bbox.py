@@ -14,7 +14,6 @@
 利用時は「地理院タイル」「国土地理院」と出典を明記してください。
 """
 
-import math
 import csv
 import io
 import sys
@@ -25,6 +24,16 @@ import rasterio
 from rasterio.transform import from_bounds
 from rasterio.warp import reproject, Resampling
 from rasterio.crs import CRS
+from rasterio.windows import Window
+
+# local subroutine
+from _tile_math import latlon_to_tile, tile_to_latlon
+from _terrain import write_terrain_products, update_terrain_products, sidecar_path, check_products
+from _composite import Compositor, row_window_transform
+from _manifest import (
+    load_manifest, save_manifest, tile_key, parse_tile_key,
+    response_meta, conditional_headers,
+)
 
 # -------------------------------
 # 設定
@@ -36,47 +45,42 @@ DEM10_URL = "https://cyberjapandata.gsi.go.jp/xyz/dem/{z}/{x}/{y}.txt"   # 10m D
 
 USER_AGENT = "Mozilla/5.0 (compatible; dem5-downloader/1.0; +https://maps.gsi.go.jp/)"
 
-# -------------------------------
-# タイル ⇔ 緯度経度 変換
-# -------------------------------
+TILE_URLS = {
+    "DEM5A": DEM5A_URL,
+    "DEM5B": DEM5B_URL,
+    "DEM10B": DEM10_URL,
+}
 
-def latlon_to_tile(lat_deg: float, lon_deg: float, zoom: int):
-    """
-    緯度経度(WGS84) -> Webメルカトルのタイル座標 (x, y)
-    （地理院タイル／Google Maps と同じ式）
-    """
-    lat_rad = math.radians(lat_deg)
-    n = 2 ** zoom
-    x = int((lon_deg + 180.0) / 360.0 * n)
-    y = int(
-        (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi)
-        / 2.0
-        * n
-    )
-    return x, y
-
-
-def tile_to_latlon(x: int, y: int, zoom: int):
-    """
-    タイル座標 (x, y, z) -> 左上隅の緯度経度 (lat, lon)
-    """
-    n = 2 ** zoom
-    lon_deg = x / n * 360.0 - 180.0
-    lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
-    lat_deg = math.degrees(lat_rad)
-    return lat_deg, lon_deg
+ZOOM_10M = 14   # DEM10 のズームレベル
 
 # -------------------------------
-# タイル 1 枚ダウンロード（DEM5 専用）
+# タイル 1 枚ダウンロード
 # -------------------------------
 
-def _download_tile(url: str, session: requests.Session, timeout: float = 10.0):
+# 条件付きリクエストで前回から変わっていなかったことを表す
+NOT_MODIFIED = object()
+
+
+def _download_tile(
+    url: str,
+    session: requests.Session,
+    timeout: float = 10.0,
+    meta: dict | None = None,
+    prev: dict | None = None,
+):
     """
     dem*.txt をダウンロードして 256x256 の float32 配列を返す。
     'e' は NaN。
+
+    meta に dict を渡すと、取得できたときに URL と ETag / Last-Modified を記録する。
+    prev に前回の meta を渡すと条件付きリクエストになり、
+    変わっていなければ (304) NOT_MODIFIED を返す。
     """
     headers = {"User-Agent": USER_AGENT}
+    headers.update(conditional_headers(prev))
     r = session.get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304 and prev:
+        return NOT_MODIFIED
     if r.status_code != 200:
         return None
 
@@ -93,78 +97,142 @@ def _download_tile(url: str, session: requests.Session, timeout: float = 10.0):
     for i, row in enumerate(rows):
         for j, val in enumerate(row):
             arr[i, j] = np.nan if val == "e" else float(val)
+
+    if meta is not None:
+        meta.update(response_meta(url, r))
     return arr
 
 
-def fetch_dem5_tile(z: int, x: int, y: int, session: requests.Session, timeout=10.0):
+def fetch_tile(kind: str, z: int, x: int, y: int, session: requests.Session, timeout: float = 10.0):
     """
-    DEM5A → DEM5B の順に試して 1 タイル取得。
-    どちらも無い場合は None を返す。
+    kind（"DEM5A" / "DEM5B" / "DEM10B"）のタイルを 1 枚取得して (配列, meta) を返す。
+    無いときは (None, {"url": url, "absent": True})。
     """
-    # DEM5A
-    url_a = DEM5A_URL.format(z=z, x=x, y=y)
-    a = _download_tile(url_a, session, timeout)
-    if a is not None:
-        return a, "DEM5A", url_a
+    url = TILE_URLS[kind].format(z=z, x=x, y=y)
+    meta = {}
+    arr = _download_tile(url, session, timeout, meta=meta)
+    if arr is None:
+        return None, {"url": url, "absent": True}
+    return arr, meta
 
-    # DEM5B
-    url_b = DEM5B_URL.format(z=z, x=x, y=y)
-    b = _download_tile(url_b, session, timeout)
-    if b is not None:
-        return b, "DEM5B", url_b
 
-    return None, None, None
+def mosaic_dem5_tile(comp, r0: int, c0: int, z: int, x: int, y: int, fetch, entry: dict | None = None):
+    """
+    DEM5 タイル (z, x, y) を comp の (r0, c0) に流し込む。
+    DEM5A に欠けがあれば（または DEM5A が無ければ）同じタイルの DEM5B で埋める。
+    DEM5 の取得はすべてここを通す（download_dem5_bbox, TileCache.dem5 も同じ）。
+    fetch(kind, z, x, y) は (配列, meta) を返す関数（fetch_tile か TileCache.fetch）。
+    entry に dict を渡すと、問い合わせたソースごとの meta を entry[種類] に記録する
+    （無かったソースも {"url": ..., "absent": True} として記録し、差分更新で再確認する）。
+    """
+    print(f"fetch DEM5 z={z}, x={x}, y={y} ...")
+    tile_a, meta_a = fetch("DEM5A", z, x, y)
+    if tile_a is not None:
+        print(f"  -> DEM5A from {meta_a['url']}")
+        comp.paste(tile_a, r0, c0, "DEM5A")
+    if entry is not None:
+        entry["DEM5A"] = meta_a
+    if tile_a is not None and not np.isnan(tile_a).any():
+        return
+
+    # DEM5A に欠けがあれば同じタイルの DEM5B で埋める
+    tile_b, meta_b = fetch("DEM5B", z, x, y)
+    if entry is not None:
+        entry["DEM5B"] = meta_b
+    if tile_b is None:
+        if tile_a is None:
+            print("  -> no DEM5 here")
+        return
+    n = comp.paste(tile_b, r0, c0, "DEM5B")
+    print(f"  -> DEM5B filled {n} pixels from {meta_b['url']}")
 
 # -------------------------------
-# DEM10 モザイクを作る
+# タイルキャッシュ
 # -------------------------------
 
-def build_dem10_mosaic(
-    north: float,
-    west: float,
-    south: float,
-    east: float,
-    zoom: int = 14,
-    nodata_value: float = -9999.0,
-):
+class TileCache:
     """
-    DEM10 (dem) を使って指定範囲をカバーするモザイク配列と transform を返す。
+    (種類, z, x, y) -> (256x256 float32 配列, meta) のキャッシュ。
+    存在しないタイルは None を覚えておき、再取得しない。
     """
-    x_west, y_north = latlon_to_tile(north, west, zoom)
-    x_east, y_south = latlon_to_tile(south, east, zoom)
-
-    x0 = min(x_west, x_east)
-    x1 = max(x_west, x_east)
-    y0 = min(y_north, y_south)
-    y1 = max(y_north, y_south)
-
-    h_tiles = x1 - x0 + 1
-    v_tiles = y1 - y0 + 1
 
-    width = h_tiles * 256
-    height = v_tiles * 256
+    def __init__(self, session: requests.Session | None = None, timeout: float = 10.0):
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self._tiles = {}
+
+    def fetch(self, kind: str, z: int, x: int, y: int):
+        """ fetch_tile と同じ (配列, meta) を返す（取得は 1 回だけ）。 """
+        key = (kind, z, x, y)
+        if key not in self._tiles:
+            self._tiles[key] = fetch_tile(kind, z, x, y, self.session, self.timeout)
+        return self._tiles[key]
+
+    def put(self, kind: str, z: int, x: int, y: int, arr, meta: dict):
+        """ 別途取得済みのタイルを登録する。 """
+        self._tiles[(kind, z, x, y)] = (arr, meta)
+
+    def dem5(self, z: int, x: int, y: int):
+        """
+        DEM5A の欠けを DEM5B で埋めたタイル（欠損は NaN）。どちらも無ければ None。
+        download_dem5_fill10_bbox と同じ mosaic_dem5_tile を通す。
+        """
+        key = ("dem5", z, x, y)
+        if key not in self._tiles:
+            comp = Compositor(256, 256)
+            mosaic_dem5_tile(comp, 0, 0, z, x, y, self.fetch)
+            tile = np.where(comp.dem == comp.nodata_value, np.nan, comp.dem).astype("float32")
+            self._tiles[key] = None if np.isnan(tile).all() else tile
+        return self._tiles[key]
+
+    def dem10(self, z: int, x: int, y: int):
+        if ("DEM10B", z, x, y) not in self._tiles:
+            print(f"fetch DEM10 z={z}, x={x}, y={y} ...")
+        return self.fetch("DEM10B", z, x, y)[0]
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-    dem10 = np.full((height, width), nodata_value, dtype="float32")
+# -------------------------------
+# DEM10 モザイクを作る
+# -------------------------------
 
-    with requests.Session() as sess:
-        for ty in range(y0, y1 + 1):
-            for tx in range(x0, x1 + 1):
-                iy = ty - y0
-                ix = tx - x0
-                url = DEM10_URL.format(z=zoom, x=tx, y=ty)
-                tile = _download_tile(url, sess)
-                if tile is None:
-                    # 無いタイルはスキップ
-                    continue
+def _dem10_tile_range(north: float, west: float, south: float, east: float, zoom: int):
+    """ 範囲を覆う DEM10 タイルの (x0, x1, y0, y1) """
+    x_west, y_north = latlon_to_tile(north, west, zoom)
+    x_east, y_south = latlon_to_tile(south, east, zoom)
+    return min(x_west, x_east), max(x_west, x_east), min(y_north, y_south), max(y_north, y_south)
 
-                r0 = iy * 256
-                c0 = ix * 256
-                dest = dem10[r0:r0+256, c0:c0+256]
 
-                mask_valid = ~np.isnan(tile)
-                overwrite = (dest == nodata_value) & mask_valid
-                dest[overwrite] = tile[overwrite]
-                dem10[r0:r0+256, c0:c0+256] = dest
+def _mosaic_dem10_range(x0, x1, y0, y1, zoom: int, nodata_value: float, fetch, metas=None, only=None):
+    """
+    DEM10 タイル範囲 x0..x1, y0..y1（両端含む）のモザイク配列と transform を返す。
+    only にタイル (x, y) の集合を渡すとそれ以外は取得せず nodata のままにする
+    （配列の大きさと transform は範囲全体のまま）。
+    metas に dict を渡すと、取得したタイル（無かったものも含む）の meta を "x/y" をキーに記録する。
+    """
+    width = (x1 - x0 + 1) * 256
+    height = (y1 - y0 + 1) * 256
+
+    comp = Compositor(height, width, nodata_value)
+
+    for ty in range(y0, y1 + 1):
+        for tx in range(x0, x1 + 1):
+            if only is not None and (tx, ty) not in only:
+                continue
+            tile, meta = fetch("DEM10B", zoom, tx, ty)
+            if metas is not None:
+                metas[tile_key(tx, ty)] = meta
+            if tile is None:
+                # 無いタイルはスキップ
+                continue
+            comp.paste(tile, (ty - y0) * 256, (tx - x0) * 256, "DEM10B")
 
     # タイル全体の境界
     north_b, west_b = tile_to_latlon(x0, y0, zoom)
@@ -172,7 +240,43 @@ def build_dem10_mosaic(
 
     transform10 = from_bounds(west_b, south_b, east_b, north_b, width, height)
 
-    return dem10, transform10
+    return comp.dem, transform10
+
+
+def build_dem10_mosaic(
+    north: float,
+    west: float,
+    south: float,
+    east: float,
+    zoom: int = 14,
+    nodata_value: float = -9999.0,
+    metas: dict | None = None,
+):
+    """
+    DEM10 (dem) を使って指定範囲をカバーするモザイク配列と transform を返す。
+    metas は _mosaic_dem10_range と同じ。
+    """
+    x0, x1, y0, y1 = _dem10_tile_range(north, west, south, east, zoom)
+    with requests.Session() as sess:
+        fetch = lambda kind, z, x, y: fetch_tile(kind, z, x, y, sess)
+        return _mosaic_dem10_range(x0, x1, y0, y1, zoom, nodata_value, fetch, metas)
+
+
+def _reproject_dem10_rows(dem10, transform10, transform, r0: int, r1: int, width: int, nodata_value: float):
+    """ DEM10 モザイクを 5m グリッド（transform）の行 r0..r1-1 に再投影した配列 """
+    block = np.full((r1 - r0, width), nodata_value, dtype="float32")
+    reproject(
+        source=dem10,
+        destination=block,
+        src_transform=transform10,
+        src_crs=CRS.from_epsg(4326),
+        dst_transform=row_window_transform(transform, r0),
+        dst_crs=CRS.from_epsg(4326),
+        resampling=Resampling.bilinear,
+        src_nodata=nodata_value,
+        dst_nodata=nodata_value,
+    )
+    return block
 
 # -------------------------------
 # メイン：DEM5 モザイク + DEM10 で穴埋め
@@ -186,16 +290,27 @@ def download_dem5_fill10_bbox(
     east: float,
     zoom_5m: int = 15,
     nodata_value: float = -9999.0,
+    products=None,
+    source_mask: bool = False,
 ):
     """
     左上（north, west）と右下（south, east）の緯度経度で指定した範囲を
     DEM5A/5B のタイルでモザイクし、欠けている場所を DEM10 で補完して
     1 枚の GeoTIFF に出力する。
+
+    products に "slope", "aspect", "hillshade" を指定すると、
+    モザイク後の配列から計算して <out_tif>_slope.tif などのサイドカーも出力する。
+
+    各ピクセルは DEM5A → DEM5B → DEM10B の順で有効な値を採用する。
+    source_mask=True なら取得元（DEM5A=1, DEM5B=2, DEM10B=3, 無し=0）を
+    <out_tif>_source.tif に書き出す。
     """
     if south >= north:
         raise ValueError("south < north になるように指定してください。")
     if east <= west:
         raise ValueError("east > west になるように指定してください。")
+    # 不正な名前はダウンロード前に弾く
+    products = check_products(products)
 
     # --- DEM5 のタイル範囲 ---
     x_west, y_north = latlon_to_tile(north, west, zoom_5m)
@@ -216,28 +331,19 @@ def download_dem5_fill10_bbox(
     print(f"[DEM5] tile y: {y0}..{y1} (count={v_tiles})")
     print(f"[DEM5] raster size: {width} x {height}")
 
-    dem5 = np.full((height, width), nodata_value, dtype="float32")
+    comp = Compositor(height, width, nodata_value, with_source_id=source_mask)
+    dem5_entries = {}
+    dem10_entries = {}
 
     # --- DEM5A/5B のモザイク ---
     with requests.Session() as sess:
+        fetch = lambda kind, z, x, y: fetch_tile(kind, z, x, y, sess)
         for ty in range(y0, y1 + 1):
             for tx in range(x0, x1 + 1):
                 iy = ty - y0
                 ix = tx - x0
-                print(f"fetch DEM5 z={zoom_5m}, x={tx}, y={ty} ...")
-                tile, kind, url = fetch_dem5_tile(zoom_5m, tx, ty, sess)
-                if tile is None:
-                    print("  -> no DEM5 here")
-                    continue
-                print(f"  -> {kind} from {url}")
-                r0 = iy * 256
-                c0 = ix * 256
-                dest = dem5[r0:r0+256, c0:c0+256]
-
-                mask_valid = ~np.isnan(tile)
-                overwrite = (dest == nodata_value) & mask_valid
-                dest[overwrite] = tile[overwrite]
-                dem5[r0:r0+256, c0:c0+256] = dest
+                entry = dem5_entries.setdefault(tile_key(tx, ty), {})
+                mosaic_dem5_tile(comp, iy * 256, ix * 256, zoom_5m, tx, ty, fetch, entry)
 
     # DEM5 タイル全体の境界
     north_b, west_b = tile_to_latlon(x0, y0, zoom_5m)
@@ -248,9 +354,10 @@ def download_dem5_fill10_bbox(
     print("※ 指定した範囲を必ず含みますが、タイル境界の分だけ少し広くなります。")
 
     transform5 = from_bounds(west_b, south_b, east_b, north_b, width, height)
+    dem10_range = _dem10_tile_range(north_b, west_b, south_b, east_b, ZOOM_10M)
 
     # --- DEM10 で穴埋め ---
-    if np.any(dem5 == nodata_value):
+    if comp.has_gaps():
         print("Some gaps remain in DEM5; trying to fill with DEM10 (10m)...")
 
         dem10, transform10 = build_dem10_mosaic(
@@ -258,31 +365,22 @@ def download_dem5_fill10_bbox(
             west=west_b,
             south=south_b,
             east=east_b,
-            zoom=14,
+            zoom=ZOOM_10M,
             nodata_value=nodata_value,
+            metas=dem10_entries,
         )
 
         if np.all(dem10 == nodata_value):
             print("DEM10 mosaic is all nodata; skip filling.")
         else:
-            dem10_on_5m = np.full_like(dem5, nodata_value, dtype="float32")
-
-            reproject(
-                source=dem10,
-                destination=dem10_on_5m,
-                src_transform=transform10,
-                src_crs=CRS.from_epsg(4326),
-                dst_transform=transform5,
-                dst_crs=CRS.from_epsg(4326),
-                resampling=Resampling.bilinear,
-                src_nodata=nodata_value,
-                dst_nodata=nodata_value,
+            # 空きのある行ブロックだけ 5m グリッドへ再投影する
+            filled_count = comp.fill_blocks(
+                lambda r0, r1: _reproject_dem10_rows(dem10, transform10, transform5, r0, r1, width, nodata_value),
+                "DEM10B",
             )
-
-            mask_fill = (dem5 == nodata_value) & (dem10_on_5m != nodata_value)
-            filled_count = np.count_nonzero(mask_fill)
             print(f"Filled {filled_count} pixels with DEM10.")
-            dem5[mask_fill] = dem10_on_5m[mask_fill]
+
+    dem5 = comp.dem
 
     # --- GeoTIFF 出力 ---
     profile = {
@@ -301,6 +399,191 @@ def download_dem5_fill10_bbox(
 
     print(f"saved: {out_tif}")
 
+    if source_mask:
+        comp.write_source_id(out_tif, transform5)
+
+    if products:
+        write_terrain_products(dem5, transform5, out_tif, products, nodata_value)
+
+    save_manifest(out_tif, {
+        "zoom_5m": zoom_5m,
+        "zoom_10m": ZOOM_10M,
+        "tiles_x": [x0, x1],
+        "tiles_y": [y0, y1],
+        # 差分更新でも同じ DEM10 グリッドに再投影するため範囲を記録する
+        "dem10_tiles_x": list(dem10_range[:2]),
+        "dem10_tiles_y": list(dem10_range[2:]),
+        "nodata": nodata_value,
+        "products": list(products),
+        "source_mask": bool(source_mask),
+        "dem5": dem5_entries,
+        "dem10": dem10_entries,
+    })
+
+
+# -------------------------------
+# 差分更新：前回ビルドから変わったタイルだけ作り直す
+# -------------------------------
+
+def _probe_tile(meta: dict, session, timeout: float = 10.0):
+    """
+    マニフェストの meta と比べてタイルを確認し、(変わったか, 配列, 新しい meta) を返す。
+    - 前回あったもの : 条件付きリクエスト。304 なら変化なし。
+    - 前回無かったもの: 取り直し、新たに公開されていれば変化あり。
+    ETag / Last-Modified が無いソースは毎回「変わった」になるが、
+    取得した配列を返すので作り直しで同じタイルを再取得する必要はない。
+    """
+    url = meta["url"]
+    new_meta = {}
+    if meta.get("absent"):
+        arr = _download_tile(url, session, timeout, meta=new_meta)
+        if arr is None:
+            return False, None, meta
+        return True, arr, new_meta
+
+    arr = _download_tile(url, session, timeout, meta=new_meta, prev=meta)
+    if arr is NOT_MODIFIED:
+        return False, None, meta
+    if arr is None:
+        return True, None, {"url": url, "absent": True}
+    return True, arr, new_meta
+
+
+def update_dem5_fill10_bbox(out_tif: str, timeout: float = 10.0):
+    """
+    download_dem5_fill10_bbox で作った out_tif を、前回のマニフェストと比べて
+    変わったタイルだけ取り直し、その 256x256 の窓だけをその場で上書きする。
+
+    - DEM5 タイル : 前回問い合わせたソース（DEM5A / DEM5B）をすべて確認する。
+                    あったものは条件付きリクエスト（ETag / Last-Modified）、
+                    無かったものは新たに公開されていないか取り直す。
+    - DEM10 タイル: 範囲内の全タイルを同様に確認し、変わっていれば
+                    その範囲と隣接する DEM5 タイルを作り直す。
+    確認で取得したタイルと作り直しで使うタイルは TileCache で共有し、二重に取得しない。
+    DEM10 はフルビルドと同じタイル範囲・グリッドで再投影するので、
+    結果は作り直しと同じになる。
+
+    source / 派生プロダクトのサイドカーも同じ窓（派生はのりしろ 1 ピクセル込み）を
+    書き直し、マニフェストを更新する。作り直したタイル (x, y) のリストを返す。
+    """
+    manifest = load_manifest(out_tif)
+    if manifest is None:
+        raise ValueError(f"マニフェストがありません。download_dem5_fill10_bbox で作り直してください: {out_tif}")
+
+    zoom_5m = manifest["zoom_5m"]
+    zoom_10m = manifest["zoom_10m"]
+    x0, x1 = manifest["tiles_x"]
+    y0, y1 = manifest["tiles_y"]
+    dx0, dx1 = manifest["dem10_tiles_x"]
+    dy0, dy1 = manifest["dem10_tiles_y"]
+    nodata_value = manifest["nodata"]
+    # 取得・上書きの前に確かめる
+    products = check_products(manifest["products"])
+    dem5_entries = manifest["dem5"]
+    dem10_entries = manifest["dem10"]
+    shift = zoom_5m - zoom_10m
+
+    # フルビルドと同じ式で 5m グリッドを作る
+    width = (x1 - x0 + 1) * 256
+    height = (y1 - y0 + 1) * 256
+    north_b, west_b = tile_to_latlon(x0, y0, zoom_5m)
+    south_b, east_b = tile_to_latlon(x1 + 1, y1 + 1, zoom_5m)
+    transform5 = from_bounds(west_b, south_b, east_b, north_b, width, height)
+
+    dirty = set()
+    with TileCache(timeout=timeout) as cache:
+        # --- 変更の検出（取得した内容と「まだ無い」結果はキャッシュに入れ、作り直しで使う）---
+        for key, entry in dem5_entries.items():
+            tx, ty = parse_tile_key(key)
+            for kind, meta in entry.items():
+                changed, arr, new_meta = _probe_tile(meta, cache.session, timeout)
+                if changed or meta.get("absent"):
+                    cache.put(kind, zoom_5m, tx, ty, arr, new_meta)
+                if changed:
+                    dirty.add((tx, ty))
+
+        for key, meta in dem10_entries.items():
+            X, Y = parse_tile_key(key)
+            changed, arr, new_meta = _probe_tile(meta, cache.session, timeout)
+            if changed or meta.get("absent"):
+                cache.put("DEM10B", zoom_10m, X, Y, arr, new_meta)
+            if not changed:
+                continue
+            # 穴埋めで取り直さなくても次回は変化なしになるよう、ここで記録する
+            dem10_entries[key] = new_meta
+            # バイリニア補間で隣の DEM5 タイルの縁も参照するので 1 タイル広げる
+            for ty in range((Y << shift) - 1, ((Y + 1) << shift) + 1):
+                for tx in range((X << shift) - 1, ((X + 1) << shift) + 1):
+                    if x0 <= tx <= x1 and y0 <= ty <= y1:
+                        dirty.add((tx, ty))
+
+        print(f"changed DEM5 tiles: {len(dirty)} / {(x1 - x0 + 1) * (y1 - y0 + 1)}")
+        if not dirty:
+            return []
+
+        # --- 変わったタイルを DEM5A/5B で作り直す ---
+        comps = {}
+        for tx, ty in sorted(dirty):
+            comp = Compositor(256, 256, nodata_value, with_source_id=manifest["source_mask"])
+            entry = {}
+            mosaic_dem5_tile(comp, 0, 0, zoom_5m, tx, ty, cache.fetch, entry)
+            dem5_entries[tile_key(tx, ty)] = entry
+            comps[(tx, ty)] = comp
+
+        # --- DEM10 で穴埋め（フルビルドと同じ DEM10 範囲・同じ行ブロックで再投影）---
+        gappy = sorted(t for t, comp in comps.items() if comp.has_gaps())
+        if gappy:
+            print(f"{len(gappy)} patched tiles have gaps; filling with DEM10 (10m)...")
+            needed = set()
+            for tx, ty in gappy:
+                X, Y = tx >> shift, ty >> shift
+                for yy in range(Y - 1, Y + 2):
+                    for xx in range(X - 1, X + 2):
+                        if dx0 <= xx <= dx1 and dy0 <= yy <= dy1:
+                            needed.add((xx, yy))
+            dem10, transform10 = _mosaic_dem10_range(
+                dx0, dx1, dy0, dy1, zoom_10m, nodata_value, cache.fetch,
+                metas=dem10_entries, only=needed,
+            )
+            if np.all(dem10 == nodata_value):
+                print("DEM10 mosaic is all nodata; skip filling.")
+            else:
+                for row in sorted({ty for _, ty in gappy}):
+                    r0 = (row - y0) * 256
+                    block = _reproject_dem10_rows(
+                        dem10, transform10, transform5, r0, min(r0 + 256, height), width, nodata_value
+                    )
+                    for tx, ty in gappy:
+                        if ty == row:
+                            c0 = (tx - x0) * 256
+                            comps[(tx, ty)].paste(block[:, c0 : c0 + 256], 0, 0, "DEM10B")
+
+    # --- 変わったタイルの窓だけ上書き ---
+    windows = []
+    with rasterio.open(out_tif, "r+") as dst:
+        for (tx, ty), comp in sorted(comps.items()):
+            window = Window((tx - x0) * 256, (ty - y0) * 256, 256, 256)
+            dst.write(comp.dem, 1, window=window)
+            if comp.source_id is not None:
+                with rasterio.open(sidecar_path(out_tif, "source"), "r+") as src_id:
+                    src_id.write(comp.source_id, 1, window=window)
+            windows.append(window)
+            print(f"patched tile x={tx}, y={ty}")
+
+    if products:
+        # 隣の窓の縁の画素も変わった標高を参照するので 1 ピクセル広げる
+        halo = []
+        for w in windows:
+            c0 = max(int(w.col_off) - 1, 0)
+            r0 = max(int(w.row_off) - 1, 0)
+            c1 = min(int(w.col_off + w.width) + 1, width)
+            r1 = min(int(w.row_off + w.height) + 1, height)
+            halo.append(Window(c0, r0, c1 - c0, r1 - r0))
+        update_terrain_products(out_tif, halo, products, nodata_value)
+
+    save_manifest(out_tif, manifest)
+    return sorted(dirty)
+
 
 if __name__ == "__main__":
 
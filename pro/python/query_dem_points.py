@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+国土地理院の標高タイルから、点列（緯度経度の配列）や折れ線に沿った
+標高をバイリニア補間で取得する。
+
+GeoTIFF は書き出さず、点が乗っているタイルだけを 1 枚ずつ取得する
+（同じタイルは TileCache で再利用）。
+DEM5A の欠けを DEM5B で埋め、残りを DEM10 で補完するのは
+download_dem5_fill10_bbox と同じ（タイル単位の処理も共通）。
+
+出典: 「地理院タイル（標高タイル）」
+  https://cyberjapandata.gsi.go.jp/xyz/dem5a/{z}/{x}/{y}.txt
+  https://cyberjapandata.gsi.go.jp/xyz/dem/{z}/{x}/{y}.txt
+利用時は「地理院タイル」「国土地理院」と出典を明記してください。
+"""
+
+import numpy as np
+
+# local subroutine
+from _tile_math import TILE_SIZE, latlon_to_pixel
+from download_dem5_fill10_bbox import TileCache
+
+EARTH_RADIUS = 6378137.0
+
+# -------------------------------
+# バイリニア補間
+# -------------------------------
+
+def _gather(ix, iy, z: int, get_tile):
+    """
+    全体ピクセル番号 (ix, iy) の値を集める。タイルは重複なしで 1 回ずつ引く。
+    タイルが無い点は NaN。
+    """
+    out = np.full(ix.shape, np.nan, dtype="float32")
+    if ix.size == 0:
+        return out
+
+    tx = ix // TILE_SIZE
+    ty = iy // TILE_SIZE
+    keys, inverse = np.unique(np.stack([tx, ty], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    for k, (x, y) in enumerate(keys):
+        tile = get_tile(z, int(x), int(y))
+        if tile is None:
+            continue
+        sel = inverse == k
+        out[sel] = tile[iy[sel] - y * TILE_SIZE, ix[sel] - x * TILE_SIZE]
+    return out
+
+
+def _bilinear(lat, lon, z: int, get_tile):
+    """
+    ピクセル中心を格子点とみなしてバイリニア補間する。
+    4 近傍のどれかが欠損なら NaN。
+    """
+    px, py = latlon_to_pixel(lat, lon, z)
+    # ピクセル (i, j) の中心は (i + 0.5, j + 0.5)
+    fx = px - 0.5
+    fy = py - 0.5
+    ix0 = np.floor(fx).astype("int64")
+    iy0 = np.floor(fy).astype("int64")
+    wx = (fx - ix0).astype("float32")
+    wy = (fy - iy0).astype("float32")
+
+    v00 = _gather(ix0,     iy0,     z, get_tile)
+    v10 = _gather(ix0 + 1, iy0,     z, get_tile)
+    v01 = _gather(ix0,     iy0 + 1, z, get_tile)
+    v11 = _gather(ix0 + 1, iy0 + 1, z, get_tile)
+
+    top = v00 * (1 - wx) + v10 * wx
+    bottom = v01 * (1 - wx) + v11 * wx
+    return top * (1 - wy) + bottom * wy
+
+# -------------------------------
+# メイン：点列の標高
+# -------------------------------
+
+def query_elevations(
+    lats,
+    lons,
+    zoom_5m: int = 15,
+    zoom_10m: int = 14,
+    cache: TileCache | None = None,
+):
+    """
+    緯度経度の配列に対する標高（float32 配列, 欠損は NaN）を返す。
+
+    まず DEM5A/5B (zoom_5m) で補間し、値が得られなかった点だけ
+    DEM10 (zoom_10m) で補間する。
+
+    Parameters
+    ----------
+    lats, lons : array_like
+        緯度・経度（WGS84, 同じ長さ）
+    zoom_5m : int
+        DEM5A/5B のズームレベル（標準 z=15）
+    zoom_10m : int
+        DEM10 のズームレベル（標準 z=14）
+    cache : TileCache
+        タイルキャッシュ。複数回呼ぶときに渡すと取得済みタイルを再利用する。
+    """
+    lats = np.asarray(lats, dtype="float64")
+    lons = np.asarray(lons, dtype="float64")
+    if lats.shape != lons.shape:
+        raise ValueError("lats と lons の形が一致しません。")
+
+    own_cache = cache is None
+    if own_cache:
+        cache = TileCache()
+
+    try:
+        flat_lat = lats.reshape(-1)
+        flat_lon = lons.reshape(-1)
+
+        elev = _bilinear(flat_lat, flat_lon, zoom_5m, cache.dem5)
+
+        gaps = np.isnan(elev)
+        if np.any(gaps):
+            print(f"{np.count_nonzero(gaps)} points have no DEM5; trying DEM10 (10m)...")
+            elev[gaps] = _bilinear(flat_lat[gaps], flat_lon[gaps], zoom_10m, cache.dem10)
+    finally:
+        if own_cache:
+            cache.close()
+
+    return elev.reshape(lats.shape)
+
+# -------------------------------
+# 折れ線に沿った断面
+# -------------------------------
+
+def densify_polyline(lats, lons, step_m: float = 5.0):
+    """
+    折れ線の頂点列を step_m [m] 以下の間隔で内挿し、
+    (lats, lons, 始点からの距離[m]) を返す。距離は球面上の大円距離。
+    """
+    lats = np.asarray(lats, dtype="float64")
+    lons = np.asarray(lons, dtype="float64")
+    if lats.ndim != 1 or lats.shape != lons.shape or lats.size < 2:
+        raise ValueError("頂点は 2 点以上の 1 次元配列で指定してください。")
+    if step_m <= 0:
+        raise ValueError("step_m は正の値を指定してください。")
+
+    phi = np.radians(lats)
+    dphi = np.diff(phi)
+    dlam = np.radians(np.diff(lons))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dlam / 2) ** 2
+    seg_len = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+    counts = np.maximum(np.ceil(seg_len / step_m).astype("int64"), 1)
+    seg_id = np.repeat(np.arange(seg_len.size), counts)
+    # 各区間内の位置 0 <= t < 1
+    t = (np.arange(seg_id.size) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[seg_id]
+
+    out_lat = np.append(lats[seg_id] + (lats[seg_id + 1] - lats[seg_id]) * t, lats[-1])
+    out_lon = np.append(lons[seg_id] + (lons[seg_id + 1] - lons[seg_id]) * t, lons[-1])
+    start = np.concatenate([[0.0], np.cumsum(seg_len)])
+    dist = np.append(start[seg_id] + seg_len[seg_id] * t, start[-1])
+    return out_lat, out_lon, dist
+
+
+def query_profile(lats, lons, step_m: float = 5.0, cache: TileCache | None = None, **kwargs):
+    """
+    折れ線に沿った標高断面 (距離[m], 緯度, 経度, 標高) を返す。
+    kwargs は query_elevations にそのまま渡す。
+    """
+    p_lat, p_lon, dist = densify_polyline(lats, lons, step_m)
+    elev = query_elevations(p_lat, p_lon, cache=cache, **kwargs)
+    return dist, p_lat, p_lon, elev
+
+
+if __name__ == "__main__":
+
+    with TileCache() as cache:
+        dist, lat, lon, elev = query_profile(
+            lats = [42.33, 42.19],
+            lons = [142.96, 143.07],
+            step_m = 5.0,
+            cache = cache,
+            )
+    print(f"points={elev.size}, min={np.nanmin(elev)}, max={np.nanmax(elev)}")